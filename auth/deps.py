@@ -1,53 +1,193 @@
+import json
+import logging
 import os
+import threading
+import uuid
+from datetime import datetime
+from hashlib import sha256
+
+import anyio
+
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+import jwt
+from jwt import InvalidTokenError as JWTError
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from db.database import get_db
+from db.database import session_factory
 from models.user import User
 
+logger = logging.getLogger(__name__)
+
 security = HTTPBearer()
 
 # .env から取得。必ず Supabase の "JWT Secret" (API設定にあるもの) を設定してください
 JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 JWT_ALGORITHM = "HS256"  # Supabase Auth は HS256 固定
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    token = credentials.credentials
+# decode のたびに dict を作り直したり secret を str→bytes 変換しないよう定数化
+JWT_OPTIONS = {"verify_aud": False, "require": ["exp", "sub"]}
+JWT_SECRET_BYTES = JWT_SECRET.encode() if isinstance(JWT_SECRET, str) else JWT_SECRET
+
+# デコード済みJWTのTTLキャッシュ。
+# HS256の検証は毎リクエストCPUを食うので、短いTTLで結果を使い回す。
+# TTLはトークンの exp より十分短くしておくこと。
+_JWT_CACHE_TTL_SEC = 30
+_jwt_cache: TTLCache = TTLCache(maxsize=4096, ttl=_JWT_CACHE_TTL_SEC)
+_jwt_cache_lock = threading.Lock()  # sync依存はthreadpoolで動くのでロック必須
+
+# 不正トークンもTTL内は再検証しないためのセンチネル
+_INVALID_TOKEN = object()
+
+# user_id -> User(detached) のTTLキャッシュ。
+# JWT検証後の SELECT を毎リクエスト撃たないようにする。
+_USER_CACHE_TTL_SEC = 60
+_user_cache: TTLCache = TTLCache(maxsize=8192, ttl=_USER_CACHE_TTL_SEC)
+_user_cache_lock = threading.Lock()
+
+# マルチワーカー構成だとプロセス内キャッシュのヒット率は 1/N に落ちるので、
+# REDIS_URL があればワーカー横断の共有キャッシュ層として使う（無ければ無効）。
+_redis = None
+if os.getenv("REDIS_URL"):
+    try:
+        from redis import asyncio as aioredis
+
+        _redis = aioredis.from_url(os.getenv("REDIS_URL"), decode_responses=True)
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed")
+
+
+async def invalidate_user_cache(user_id) -> None:
+    """ユーザー情報を更新するエンドポイントから呼ぶ（キャッシュの古い行を捨てる）"""
+    user_id = str(user_id)
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+    if _redis is not None:
+        try:
+            await _redis.delete(f"user:{user_id}")
+        except Exception:
+            pass  # Redis落ちてもauth自体は生かす
+
+
+def _decode_token(token: str) -> dict:
+    """
+    jwt.decode の結果をTTLキャッシュする。
+    キーは生トークンのsha256先頭16バイト（メモリ節約）。
+    不正トークンは JWTError を投げる（キャッシュヒット時も同様）。
+    """
+    key = sha256(token.encode()).digest()[:16]
+
+    with _jwt_cache_lock:
+        cached = _jwt_cache.get(key)
+    if cached is _INVALID_TOKEN:
+        raise JWTError("Invalid token (cached)")
+    if cached is not None:
+        return cached
 
     try:
         # SupabaseのJWTには 'aud': 'authenticated' が含まれており、
         # デフォルトの検証ではエラーになることが多いため、verify_aud を False に設定します。
+        # exp / sub の必須チェックも decode 1回の中で済ませる。
         payload = jwt.decode(
-            token, 
-            JWT_SECRET, 
+            token,
+            JWT_SECRET_BYTES,
             algorithms=[JWT_ALGORITHM],
-            options={"verify_aud": False}
+            options=JWT_OPTIONS,
         )
-        
-        user_id = payload.get("sub")
-        if not user_id:
-            print("❌ [DEBUG] JWTに 'sub' (User ID) が含まれていません")
-            raise JWTError("Missing subject claim")
-            
-    except JWTError as e:
-        # ターミナルにエラー内容を詳しく表示して原因を突き止めやすくします
-        print(f"❌ [DEBUG] JWT検証エラー: {e}")
+    except JWTError:
+        with _jwt_cache_lock:
+            _jwt_cache[key] = _INVALID_TOKEN
+        raise
+
+    with _jwt_cache_lock:
+        _jwt_cache[key] = payload
+    return payload
+
+
+async def _decode_token_shared(token: str) -> dict:
+    """
+    _decode_token に Redis の共有層を挟む（cache-aside）。
+    プロセス内ヒット → Redisヒット → 実デコードの順。
+    """
+    key = sha256(token.encode()).digest()[:16]
+
+    with _jwt_cache_lock:
+        cached = _jwt_cache.get(key)
+    if cached is _INVALID_TOKEN:
+        raise JWTError("Invalid token (cached)")
+    if cached is not None:
+        return cached
+
+    if _redis is not None:
+        try:
+            raw = await _redis.get(f"jwt:{key.hex()}")
+        except Exception:
+            raw = None
+        if raw:
+            payload = json.loads(raw)
+            with _jwt_cache_lock:
+                _jwt_cache[key] = payload
+            return payload
+
+    payload = _decode_token(token)
+
+    if _redis is not None:
+        try:
+            await _redis.setex(
+                f"jwt:{key.hex()}", _JWT_CACHE_TTL_SEC, json.dumps(payload)
+            )
+        except Exception:
+            pass
+
+    return payload
+
+
+def _user_to_cache_json(user: User) -> str:
+    """Redisに置く最小限のユーザー情報"""
+    return json.dumps({
+        "user_id": str(user.user_id),
+        "name": user.name,
+        "email": user.email,
+        "chronotype": user.chronotype,
+        "ai_status": user.ai_status,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+    })
+
+
+def _user_from_cache_json(raw: str) -> User:
+    """Redisのキャッシュから detached な User を復元する（SELECTなしで返せる状態）"""
+    data = json.loads(raw)
+    created_at = data.get("created_at")
+    user = User(
+        # カラムは UUID(as_uuid=True)。str のままだと task.user_id != user.user_id の
+        # 所有チェックが常にTrueになってしまうので、DB経由の行と同じ型に揃える
+        user_id=uuid.UUID(data["user_id"]),
+        name=data.get("name"),
+        email=data.get("email"),
+        chronotype=data.get("chronotype"),
+        ai_status=data.get("ai_status"),
+        created_at=datetime.fromisoformat(created_at) if created_at else None,
+    )
+    make_transient_to_detached(user)
+    return user
+
+
+def _fetch_or_create_user(db: Session, user_id: str) -> User:
+    """DBからユーザーを取得。初回ログイン時は自動作成（ブロッキングなのでthreadpoolで呼ぶ）"""
+    # 主キー検索は Session.get で（identity mapに乗っていればSQLすら出ない）。
+    # カラムは UUID(as_uuid=True) なので、str のまま渡さず UUID に揃える
+    try:
+        pk = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
+    except ValueError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid or expired JWT token: {str(e)}",
+            detail="Invalid user id in token",
         )
+    user = db.get(User, pk)
 
-    # ユーザーをデータベースから取得
-    user = db.query(User).filter(User.user_id == user_id).first()
-
-    # 初回ログイン時は自動作成
     if user is None:
-        print(f"🆕 [DEBUG] 新規ユーザー登録: {user_id}")
+        logger.info("新規ユーザー登録: %s", user_id)
         try:
             user = User(user_id=user_id)
             db.add(user)
@@ -55,10 +195,80 @@ def get_current_user(
             db.refresh(user)
         except Exception as e:
             db.rollback()
-            print(f"❌ [DEBUG] ユーザー作成失敗: {e}")
+            logger.error("ユーザー作成失敗: %s", e, exc_info=True)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Could not create user in database."
             )
 
+    return user
+
+
+def _load_user_with_own_session(user_id: str) -> User:
+    """
+    キャッシュミス時だけ呼ばれる。auth専用の短命セッションを開いて
+    すぐ返す（Depends(get_db) だとキャッシュヒット時も接続を掴んでしまう）。
+    """
+    db = session_factory()
+    try:
+        user = _fetch_or_create_user(db, user_id)
+        db.expunge(user)  # セッションを閉じても属性を読めるように切り離す
+        return user
+    finally:
+        db.close()
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    token = credentials.credentials
+
+    try:
+        payload = await _decode_token_shared(token)
+
+        user_id = payload.get("sub")
+        if not user_id:
+            logger.warning("JWTに 'sub' (User ID) が含まれていません")
+            raise JWTError("Missing subject claim")
+            
+    except JWTError as e:
+        # ターミナルにエラー内容を詳しく表示して原因を突き止めやすくします
+        logger.warning("JWT検証エラー: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Invalid or expired JWT token: {str(e)}",
+        )
+
+    # キャッシュヒットならDB接続を一切掴まずに返せる
+    with _user_cache_lock:
+        cached_user = _user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
+
+    # Redis（ワーカー横断）にいればDBを触らず復元
+    if _redis is not None:
+        try:
+            raw = await _redis.get(f"user:{user_id}")
+        except Exception:
+            raw = None
+        if raw:
+            user = _user_from_cache_json(raw)
+            with _user_cache_lock:
+                _user_cache[user_id] = user
+            return user
+
+    # キャッシュミス時だけDBへ。sync Session なのでthreadpoolに逃がす
+    user = await anyio.to_thread.run_sync(_load_user_with_own_session, user_id)
+
+    with _user_cache_lock:
+        _user_cache[user_id] = user
+
+    if _redis is not None:
+        try:
+            await _redis.setex(
+                f"user:{user_id}", _USER_CACHE_TTL_SEC, _user_to_cache_json(user)
+            )
+        except Exception:
+            pass
+
     return user
\ No newline at end of file
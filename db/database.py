@@ -3,6 +3,7 @@ import os
 from dotenv import load_dotenv
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 load_dotenv()
@@ -11,18 +12,74 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set in environment variables")
 
+# 接続プール設定（env で上書き可）。
+# Render のワーカー数 × pool_size + max_overflow が
+# Postgres の max_connections を超えないように調整すること。
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
 engine = create_engine(
     DATABASE_URL,
-    echo=True,   # 開発中だけ。うるさければ False にしてOK
+    echo=False,  # echo=True は全SQLがloggingを通るので本番では切る
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=30,
+    pool_recycle=1800,   # 古い接続を使い回してエラーになるのを防ぐ
+    pool_pre_ping=True,  # 死んだ接続を掴まない
+    pool_use_lifo=True,  # 直近に使った接続を優先（キャッシュが温かい）
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: commit後も属性を持ち続け、レスポンス詰め直しの再SELECTをなくす
+# session_factory は依存の外で短命セッションを作りたい箇所（auth等）でも使う
+session_factory = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
 
 Base = declarative_base()
 
 def get_db():
-    db = SessionLocal()
+    # scoped_session は使わない: FastAPIはsync依存のsetup/endpoint/teardownを
+    # 別々のthreadpoolスレッドで走らせ得るので、スレッドローカル前提の
+    # remove() が他リクエストのセッションを閉じてしまう。
+    # セッション生成は軽い（コネクションはプールから借りるだけ）ので毎回作って確実に閉じる
+    db = session_factory()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# -------------------------
+# async engine（tasks ルーター用）
+# -------------------------
+def _to_async_url(url: str) -> str:
+    """psycopg2向けのURLをasyncpgドライバ付きに読み替える"""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgres://"):  # SupabaseのURL表記
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):  # ローカル確認用
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+# 同期側とプールを分け合うので、合計が max_connections を超えないように
+# 両方とも env で絞れるようにしてある
+async_engine = create_async_engine(
+    _to_async_url(DATABASE_URL),
+    echo=False,
+    pool_size=int(os.getenv("DB_ASYNC_POOL_SIZE", str(POOL_SIZE))),
+    max_overflow=int(os.getenv("DB_ASYNC_MAX_OVERFLOW", str(MAX_OVERFLOW))),
+    pool_timeout=30,
+    pool_recycle=1800,
+    pool_pre_ping=True,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
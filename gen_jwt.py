@@ -1,4 +1,7 @@
-from jose import jwt
+import base64
+import hashlib
+import hmac
+import json
 import time
 import os
 from dotenv import load_dotenv
@@ -17,5 +20,17 @@ payload = {
     "exp": int(time.time()) + 60 * 60 * 24  # 24時間有効
 }
 
-token = jwt.encode(payload, SECRET, algorithm="HS256")
-print(token)
\ No newline at end of file
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+# HS256 の JWT は stdlib だけで組める（header.payload.signature）
+header = _b64url(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+body = _b64url(json.dumps(payload).encode())
+sig = _b64url(
+    hmac.new(SECRET.encode(), f"{header}.{body}".encode(), hashlib.sha256).digest()
+)
+
+token = f"{header}.{body}.{sig}"
+print(token)
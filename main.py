@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from datetime import datetime, timezone
+import os
 import time
 
 from db.database import engine, Base
@@ -15,7 +17,8 @@ from routers import auth, tasks, event_logs, ai, plants
 from services.ml_score_service import load_model
 
 
-app = FastAPI()
+# レスポンスのJSON化をorjson（C実装）に寄せる。全エンドポイント共通で効く
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # 起動時間の記録（任意）
 STARTED_AT = time.time()
@@ -46,7 +49,9 @@ def _startup():
     - MLモデルロード
     """
     # DBテーブル作成（import時ではなく起動時に回す）
-    Base.metadata.create_all(bind=engine)
+    # マイグレーション運用に移行したら AUTO_CREATE_TABLES=0 でスキップできる
+    if os.getenv("AUTO_CREATE_TABLES", "1") == "1":
+        Base.metadata.create_all(bind=engine)
 
     # MLモデルロード（重いなら try/except で落ちないようにするのもアリ）
     load_model()
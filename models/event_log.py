@@ -1,12 +1,15 @@
 # models/event_log.py
-from sqlalchemy import Column, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, JSON
+from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
 from db.database import Base
-import uuid
 from datetime import datetime
+import uuid
 
 class EventLog(Base):
     __tablename__ = "event_logs"
+    # /ai/feedback の「ユーザー×期間」フィルタをインデックススキャンにする
+    __table_args__ = (Index("ix_event_logs_user_ts", "user_id", "timestamp"),)
 
     log_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -16,4 +19,6 @@ class EventLog(Base):
     event_type = Column(String, nullable=False)
     data = Column(JSON)
     device = Column(String)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # default= も残す: create_all は既存テーブルにDDLのDEFAULTを足さないので、
+    # 旧スキーマのDBでも NULL timestamp を入れないためのフォールバック
+    timestamp = Column(DateTime, default=datetime.utcnow, server_default=func.now())
\ No newline at end of file
@@ -1,8 +1,9 @@
 from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
 from db.database import Base
-import uuid
 from datetime import datetime
+import uuid
 
 class Plant(Base):
     __tablename__ = "plants"
@@ -10,4 +11,7 @@ class Plant(Base):
     plant_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id"), unique=True, nullable=False)
     level = Column(Integer, default=0)
-    last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # default= も残す: create_all は既存テーブルにDDLのDEFAULTを足さない（旧スキーマ対策）
+    last_updated = Column(
+        DateTime, default=datetime.utcnow, server_default=func.now(), onupdate=func.now()
+    )
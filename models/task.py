@@ -1,12 +1,21 @@
 # models/task.py
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
 from db.database import Base
-import uuid
 from datetime import datetime
+import uuid
 
 class Task(Base):
     __tablename__ = "tasks"
+    # ステータス集計と streak 計算（completed_at）をユーザー単位で索引引きにする
+    __table_args__ = (
+        Index("ix_tasks_user_taskid", "user_id", "task_id"),
+        Index("ix_tasks_user_status", "user_id", "status"),
+        Index("ix_tasks_user_completed", "user_id", "completed_at"),
+        # 植物レベルの週次集計（user_id + created_at範囲 + status）をindex-only scanにする
+        Index("ix_tasks_user_created_status", "user_id", "created_at", "status"),
+    )
 
     task_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id"))
@@ -17,5 +26,8 @@ class Task(Base):
     category = Column(String)
     status = Column(String)  # pending / completed / missed
     completed_at = Column(DateTime)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # default= も残す: create_all は既存テーブルにDDLのDEFAULTを足さない（旧スキーマ対策）
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, server_default=func.now(), onupdate=func.now()
+    )
\ No newline at end of file
@@ -1,9 +1,10 @@
 # models/user.py
 from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
 from db.database import Base
-import uuid
 from datetime import datetime
+import uuid
 
 class User(Base):
     __tablename__ = "users"
@@ -13,4 +14,5 @@ class User(Base):
     email = Column(String)
     chronotype = Column(String)  # morning / night_owl / neutral
     ai_status = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # default= も残す: create_all は既存テーブルにDDLのDEFAULTを足さない（旧スキーマ対策）
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
\ No newline at end of file
@@ -1,6 +1,9 @@
+import asyncio
+
+import anyio
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from db.database import get_db
+from sqlalchemy import extract, func, select
+from db.database import session_factory
 
 from models.task import Task
 from models.event_log import EventLog
@@ -10,11 +13,16 @@ from auth.deps import get_current_user
 from services.ai_service import calculate_scores, generate_feedback
 from services.ml_score_service import predict_total_score_debug  # ★変更（debug付き）
 
-from schemas.ai import AIInput, AIUser, AIScore, AISummary, AIPatterns
 import datetime
+import sys
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
+# enum→文字列の解決はプロセス内で不変なのでモジュールロード時に1回だけ
+_WAKE_TIME_LOGGED = EventType.WAKE_TIME_LOGGED.value
+_DAILY_CHECK_IN = EventType.DAILY_CHECK_IN.value
+_TASK_CREATED = EventType.TASK_CREATED.value
+
 
 # -------------------------
 # utils
@@ -23,82 +31,164 @@ def _fmt_hhmm(dt: datetime.datetime) -> str:
     return dt.strftime("%H:%M")
 
 
+# 3.11+ の fromisoformat は末尾 "Z" をそのまま受けるので置換が不要
+_FROMISO_HANDLES_Z = sys.version_info >= (3, 11)
+
+
 def _parse_iso(dt_str: str) -> datetime.datetime | None:
     try:
-        if dt_str.endswith("Z"):
-            dt_str = dt_str.replace("Z", "+00:00")
+        if not _FROMISO_HANDLES_Z and dt_str.endswith("Z"):
+            dt_str = dt_str[:-1] + "+00:00"
         return datetime.datetime.fromisoformat(dt_str)
     except Exception:
         return None
 
 
-def _calc_streak_days(tasks: list[Task], today: datetime.date) -> int:
+def _calc_streak_days(done_dates: set[datetime.date], today: datetime.date) -> int:
     """
-    completed_at から「今日までの連続完了日数」を計算
+    完了日の集合から「今日までの連続完了日数」を計算
     その日に1つでも完了があればOK
     """
-    done_dates = set()
-    for t in tasks:
-        if t.completed_at:
-            done_dates.add(t.completed_at.date())
-
     streak = 0
     d = today
+    one_day = datetime.timedelta(days=1)
     while d in done_dates:
         streak += 1
-        d -= datetime.timedelta(days=1)
+        d -= one_day
 
     return streak
 
 
+# -------------------------
+# DB fetch helpers
+# -------------------------
+# 各クエリは独立なので、専用の短命セッションで並列に流す（asyncio.gather用）。
+# 返り値は読み取り専用で使うのでセッションを閉じても問題ない。
+def _fetch_today_logs(user_id, start, end) -> list:
+    """今日のログ。ORMに積まず必要列のRowタプルで受ける（属性アクセスは同じ書き方で通る）"""
+    db = session_factory()
+    try:
+        return db.execute(
+            select(
+                EventLog.timestamp,
+                EventLog.event_type,
+                EventLog.data,
+                EventLog.task_id,
+            )
+            .where(
+                EventLog.user_id == user_id,
+                EventLog.timestamp >= start,
+                EventLog.timestamp < end,
+            )
+            .order_by(EventLog.timestamp.asc())
+        ).all()
+    finally:
+        db.close()
+
+
+def _fetch_hour_rows(user_id, start, end):
+    """時間帯ヒストグラム（1クエリで全ログ/タスク作成ログ両方）"""
+    db = session_factory()
+    try:
+        return db.execute(
+            select(
+                extract("hour", EventLog.timestamp).label("hour"),
+                func.count().label("total"),
+                func.count()
+                .filter(EventLog.event_type == _TASK_CREATED)
+                .label("created"),
+            )
+            .where(
+                EventLog.user_id == user_id,
+                EventLog.timestamp >= start,
+                EventLog.timestamp < end,
+            )
+            .group_by("hour")
+        ).all()
+    finally:
+        db.close()
+
+
+# streak はこの日数より前まで遡らない（DISTINCTで返る行数の上限にもなる）
+_STREAK_LOOKBACK_DAYS = 90
+
+
+def _fetch_done_dates(user_id) -> set[datetime.date]:
+    """streak用にユニークな完了日だけをDBから取る（全タスクを持ってこない）"""
+    db = session_factory()
+    try:
+        done_date = func.date(Task.completed_at)
+        rows = db.execute(
+            select(done_date)
+            .where(Task.user_id == user_id, Task.completed_at.isnot(None))
+            .distinct()
+            .order_by(done_date.desc())
+            .limit(_STREAK_LOOKBACK_DAYS)
+        ).scalars()
+        return set(rows)
+    finally:
+        db.close()
+
+
+def _fetch_task_counts(user_id):
+    """完了/期限切れの件数（DB側で集計）"""
+    db = session_factory()
+    try:
+        return db.execute(
+            select(
+                func.count().filter(Task.status == "completed").label("completed"),
+                func.count().filter(Task.status == "missed").label("missed"),
+            ).where(Task.user_id == user_id)
+        ).one()
+    finally:
+        db.close()
+
+
 # -------------------------
 # endpoint
 # -------------------------
 @router.post("/feedback")
-def ai_feedback(
-    db: Session = Depends(get_db),
+async def ai_feedback(
     user=Depends(get_current_user),
 ):
-    today = datetime.date.today()
+    # UTC基準の「今日」。半開区間 [start, end) にして btree のレンジスキャンに乗せる
+    today = datetime.datetime.now(datetime.timezone.utc).date()
     start = datetime.datetime.combine(today, datetime.time.min)
-    end = datetime.datetime.combine(today, datetime.time.max)
-
-    # 今日のログ
-    logs: list[EventLog] = (
-        db.query(EventLog)
-        .filter(
-            EventLog.user_id == user.user_id,
-            EventLog.timestamp >= start,
-            EventLog.timestamp <= end,
-        )
-        .order_by(EventLog.timestamp.asc())
-        .all()
-    )
-
-    # タスクは過去分も含めて取得（streak用）
-    tasks: list[Task] = (
-        db.query(Task)
-        .filter(Task.user_id == user.user_id)
-        .all()
+    end = start + datetime.timedelta(days=1)
+
+    # クエリは互いに独立なので並列で投げて往復を重ねる
+    logs, hour_rows, done_dates, task_counts = await asyncio.gather(
+        anyio.to_thread.run_sync(_fetch_today_logs, user.user_id, start, end),
+        anyio.to_thread.run_sync(_fetch_hour_rows, user.user_id, start, end),
+        anyio.to_thread.run_sync(_fetch_done_dates, user.user_id),
+        anyio.to_thread.run_sync(_fetch_task_counts, user.user_id),
     )
 
     # -------------------------
-    # wake_time
+    # wake_time / daily_check_in（ログは1周だけ見る）
     # -------------------------
+    wake_log = None
+    daily_check_in = False
+    for l in logs:
+        et = l.event_type
+        if wake_log is None and et == _WAKE_TIME_LOGGED and l.data:
+            wake_log = l
+        elif not daily_check_in and et == _DAILY_CHECK_IN:
+            daily_check_in = True
+        if wake_log is not None and daily_check_in:
+            break
+
     wake_time = "00:00"
-    wake_log = next((l for l in logs if l.event_type == EventType.WAKE_TIME_LOGGED.value and l.data), None)
+    wake_dt = None
     if wake_log and isinstance(wake_log.data, dict) and wake_log.data.get("time"):
-        dt = _parse_iso(wake_log.data["time"])
-        if dt:
-            wake_time = _fmt_hhmm(dt)
-
-    # daily_check_in の有無
-    daily_check_in = any(l.event_type == EventType.DAILY_CHECK_IN.value for l in logs)
+        wake_dt = _parse_iso(wake_log.data["time"])
+        if wake_dt:
+            wake_time = _fmt_hhmm(wake_dt)
 
     # -------------------------
     # streak_days
     # -------------------------
-    streak_days = _calc_streak_days(tasks, today)
+    streak_days = _calc_streak_days(done_dates, today)
 
     # -------------------------
     # first_action_time
@@ -108,75 +198,72 @@ def ai_feedback(
     # -------------------------
     # patterns
     # -------------------------
-    # most_active_hour
-    hour_counts: dict[int, int] = {}
-    for l in logs:
-        h = l.timestamp.hour
-        hour_counts[h] = hour_counts.get(h, 0) + 1
-    most_active_hour = max(hour_counts, key=hour_counts.get) if hour_counts else 0
-
-    # task_creation_hour
-    create_hour_counts: dict[int, int] = {}
-    for l in logs:
-        if l.event_type == EventType.TASK_CREATED.value:
-            h = l.timestamp.hour
-            create_hour_counts[h] = create_hour_counts.get(h, 0) + 1
-    task_creation_hour = max(create_hour_counts, key=create_hour_counts.get) if create_hour_counts else 0
-
-    # is_morning_person（暫定）
-    is_morning_person = False
-    if wake_log and wake_log.data.get("time"):
-        dt = _parse_iso(wake_log.data["time"])
-        if dt and 4 <= dt.hour <= 9:
-            is_morning_person = True
+    # argmax は行を読むついでに1周で両方追う（max + リスト内包の2周をやめる）
+    most_active_hour = 0
+    task_creation_hour = 0
+    best_total = -1
+    best_created = 0
+    for r in hour_rows:
+        if r.total > best_total:
+            best_total = r.total
+            most_active_hour = int(r.hour)
+        if r.created > best_created:
+            best_created = r.created
+            task_creation_hour = int(r.hour)
+
+    # is_morning_person（暫定。wake_dt は上で1回だけパース済み）
+    is_morning_person = bool(wake_dt and 4 <= wake_dt.hour <= 9)
 
     # -------------------------
-    # summary
+    # summary / patterns
     # -------------------------
-    summary = AISummary(
-        completed_tasks=sum(1 for t in tasks if t.status == "completed"),
-        overdue_tasks=sum(1 for t in tasks if t.status == "missed"),
-        streak_days=streak_days,
-        first_action_time=first_action_time,
-        wake_time=wake_time,
-    )
+    # generate_feedback に渡すだけの内部データなので、Pydanticの
+    # バリデーションを通さずプレーンな dict で組む
+    summary = {
+        "completed_tasks": task_counts.completed,
+        "overdue_tasks": task_counts.missed,
+        "streak_days": streak_days,
+        "first_action_time": first_action_time,
+        "wake_time": wake_time,
+    }
 
-    patterns = AIPatterns(
-        most_active_hour=most_active_hour,
-        task_creation_hour=task_creation_hour,
-        is_morning_person=is_morning_person,
-    )
+    patterns = {
+        "most_active_hour": most_active_hour,
+        "task_creation_hour": task_creation_hour,
+        "is_morning_person": is_morning_person,
+    }
 
     # -------------------------
     # scores（ルールベース + ML total差し替え）
     # -------------------------
-    score_dict = calculate_scores(logs, tasks, user)
+    score_dict = calculate_scores(logs, task_counts.completed, task_counts.missed, user)
     rule_total = int(score_dict.get("total", 0))
 
-    ml_total, ml_features = predict_total_score_debug(logs, tasks, user)
+    ml_total, ml_features = predict_total_score_debug(
+        logs, task_counts.completed, task_counts.missed, user
+    )
 
     # ★ MLモデルがあれば total を差し替え
     if ml_total is not None:
         score_dict["total"] = int(round(ml_total))
 
-    scores = AIScore(**score_dict)
-
     # -------------------------
     # AI input
     # -------------------------
-    input_data = AIInput(
-        user_id=str(user.user_id),
-        user=AIUser(
-            name=user.name or "",
-            chronotype=user.chronotype or "neutral",
-            ai_status=user.ai_status or "default",
-        ),
-        scores=scores,
-        summary=summary,
-        patterns=patterns,
-    )
+    input_data = {
+        "user_id": str(user.user_id),
+        "user": {
+            "name": user.name or "",
+            "chronotype": user.chronotype or "neutral",
+            "ai_status": user.ai_status or "default",
+        },
+        "scores": score_dict,
+        "summary": summary,
+        "patterns": patterns,
+    }
 
-    result = generate_feedback(input_data.model_dump())
+    # asyncクライアントなのでイベントループ上でそのまま待てる
+    result = await generate_feedback(input_data)
 
     # ★開発用debug（後で消す）
     result["debug"] = {
@@ -1,40 +1,90 @@
 # routers/event_logs.py
-from fastapi import APIRouter, Depends
+import logging
+import threading
+import uuid
+from datetime import datetime
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Query
 from sqlalchemy.orm import Session
-from db.database import get_db
+from db.database import get_db, session_factory
 from auth.deps import get_current_user
 from schemas.event_log import EventLogCreate, EventLogResponse
 from models.event_log import EventLog
 from typing import List
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/event_logs",
     tags=["Event Logs"]
 )
 
+# 書き込みはレスポンスを返した後にまとめて流す（fire-and-forget）。
+# 同時に来たリクエスト分は1回の bulk insert に相乗りする。
+_pending_logs: list[dict] = []
+_pending_lock = threading.Lock()
+
+
+def _flush_event_logs() -> None:
+    """溜まっているログを1回のbulk insertで書き込む（失敗してもAPIは落とさない）"""
+    with _pending_lock:
+        batch = _pending_logs[:]
+        _pending_logs.clear()
+
+    if not batch:
+        return  # 直前のflushが持っていった
+
+    db = session_factory()
+    try:
+        db.bulk_insert_mappings(EventLog, batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.warning("event_log flush failed (%d rows dropped)", len(batch), exc_info=True)
+    finally:
+        db.close()
+
+
 @router.post("/", response_model=EventLogResponse)
 def create_event_log(
     data: EventLogCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
     user = Depends(get_current_user)
 ):
-    log = EventLog(
-        user_id=user.user_id,
-        task_id=data.task_id,
-        event_type=data.event_type.value,
-        data=data.data,
-        device=data.device
-    )
-
-    db.add(log)
-    db.commit()
-    db.refresh(log)
+    # log_id / timestamp をこちらで確定させれば、INSERTを待たずに返せる
+    log = {
+        "log_id": uuid.uuid4(),
+        "user_id": user.user_id,
+        "task_id": data.task_id,
+        "event_type": data.event_type.value,
+        "data": data.data,
+        "device": data.device,
+        "timestamp": datetime.utcnow(),
+    }
+
+    with _pending_lock:
+        _pending_logs.append(log)
+    background_tasks.add_task(_flush_event_logs)
+
     return log
 
 @router.get("/", response_model=List[EventLogResponse])
 def get_event_logs(
+    since: datetime | None = None,
+    limit: int = Query(default=500, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0),
     db: Session = Depends(get_db),
     user = Depends(get_current_user)
 ):
-    logs = db.query(EventLog).filter(EventLog.user_id == user.user_id).all()
-    return logs
\ No newline at end of file
+    # 全件返しはアクティブユーザーでメモリが際限なく伸びるので、
+    # 期間・件数の絞り込みをDB側でやる（(user_id, timestamp) インデックスに乗る）
+    query = db.query(EventLog).filter(EventLog.user_id == user.user_id)
+    if since is not None:
+        query = query.filter(EventLog.timestamp >= since)
+
+    return (
+        query.order_by(EventLog.timestamp.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
\ No newline at end of file
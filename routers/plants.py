@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from db.database import get_db
 from auth.deps import get_current_user
@@ -6,6 +7,7 @@ from models.user import User
 from models.plant import Plant
 from schemas.plant import PlantResponse
 from datetime import datetime
+import uuid
 
 router = APIRouter(
     prefix="/plants",
@@ -21,18 +23,29 @@ def get_my_plant(
     現在ログイン中のユーザーの植物データを取得
     存在しない場合は level=0 で新規作成
     """
-    # ユーザーの植物を取得
+    # ほぼ毎回ヒットする読み取りパスは書き込みなしで返す
+    # （毎GETをupsertにするとdead tuple+WAL+行ロックが読み取りに乗ってしまう）
     plant = db.query(Plant).filter(Plant.user_id == user.user_id).first()
-    
-    # 存在しない場合は新規作成
-    if plant is None:
-        plant = Plant(
+    if plant is not None:
+        return plant
+
+    # 初回のみINSERT。同時リクエストのレースは DO NOTHING で吸収し、
+    # 負けた側（RETURNINGが空）は勝った側の行をSELECTし直す
+    stmt = (
+        insert(Plant)
+        .values(
+            plant_id=uuid.uuid4(),
             user_id=user.user_id,
             level=0,
-            last_updated=datetime.utcnow()
+            last_updated=datetime.utcnow(),
         )
-        db.add(plant)
-        db.commit()
-        db.refresh(plant)
-    
+        .on_conflict_do_nothing(index_elements=["user_id"])
+        .returning(Plant)
+    )
+    plant = db.execute(stmt).scalar_one_or_none()
+    db.commit()
+
+    if plant is None:
+        plant = db.query(Plant).filter(Plant.user_id == user.user_id).first()
+
     return plant
@@ -1,15 +1,19 @@
 # routers/tasks.py
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db.database import get_db
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
 
 from models.task import Task
 from models.event_log import EventLog
-from schemas.task import TaskCreate, TaskUpdate, TaskResponse, TaskWithPlantResponse
+from schemas.task import TaskCreate, TaskStatus, TaskUpdate, TaskResponse
 from schemas.event_log import EventType
 from auth.deps import get_current_user
 from services.plant_service import update_plant_level
 
+from pydantic import TypeAdapter
+
 from datetime import datetime, timezone
 from uuid import UUID
 from typing import List
@@ -20,100 +24,191 @@ router = APIRouter(prefix="/tasks", tags=["Tasks"])
 # -------------------------
 # utility
 # -------------------------
+_UTC = timezone.utc
+
+
 def to_naive_utc(dt: datetime | None):
     """
     aware / naive を問わず UTC naive に揃える
     """
-    if dt is None:
-        return None
-    if dt.tzinfo is not None and dt.utcoffset() is not None:
-        return dt.astimezone(timezone.utc).replace(tzinfo=None)
-    return dt
+    return (
+        dt.astimezone(_UTC).replace(tzinfo=None)
+        if dt is not None and dt.tzinfo is not None
+        else dt
+    )
+
+
+_TASK_FIELDS = tuple(TaskResponse.model_fields)
+
+# リストのdumpはpydantic-core（C実装）に一括で任せる
+_task_list_adapter = TypeAdapter(list[TaskResponse])
+
+
+def _task_response(task: Task) -> TaskResponse:
+    """DB由来の値は既にスキーマ通りなので、バリデーションを飛ばして詰めるだけにする"""
+    return TaskResponse.model_construct(**{f: getattr(task, f) for f in _TASK_FIELDS})
+
+
+async def _get_own_task(db: AsyncSession, user_id, task_id: UUID) -> Task:
+    # 主キーで引く（同一セッション内ならidentity mapに乗ってSELECT自体が省ける）。
+    # 所有チェックはPython側で行い、他人のタスクは存在しない扱いにする
+    task = await db.get(Task, task_id)
+
+    if task is None or task.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return task
 
 
 # -------------------------
 # endpoints
 # -------------------------
-@router.get("/", response_model=List[TaskResponse])
-def get_tasks(db: Session = Depends(get_db), user=Depends(get_current_user)):
-    return db.query(Task).filter(Task.user_id == user.user_id).all()
-
-
-@router.post("/", response_model=TaskResponse)
-def create_task(task: TaskCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    new_task = Task(
-        user_id=user.user_id,
-        title=task.title,
-        due_date=task.due_date,
-        self_due_date=task.self_due_date,
-        priority=task.priority,
-        category=task.category,
-        status=task.status,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow(),
+@router.get("/", response_model=None)
+async def get_tasks(
+    db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)
+):
+    result = await db.execute(select(Task).where(Task.user_id == user.user_id))
+    # response_model を通すとN件ぶん再バリデーションされるので手で詰め、
+    # jsonable_encoderのPythonループを避けてアダプタ経由でorjsonに渡す
+    tasks = [_task_response(t) for t in result.scalars()]
+    return ORJSONResponse(_task_list_adapter.dump_python(tasks))
+
+
+@router.post("/", response_model=None)
+async def create_task(
+    task: TaskCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+) -> TaskResponse:
+    # utcnow() は3.12でdeprecated。1回だけ取ってUTC naiveに揃えて使い回す
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    # add/commit/refresh の INSERT+SELECT を INSERT...RETURNING の1文にまとめる
+    stmt = (
+        insert(Task)
+        .values(
+            user_id=user.user_id,
+            title=task.title,
+            due_date=task.due_date,
+            self_due_date=task.self_due_date,
+            priority=task.priority,
+            category=task.category,
+            status=task.status.value if task.status is not None else None,
+            created_at=now,
+            updated_at=now,
+        )
+        .returning(Task)
     )
-    db.add(new_task)
-    db.commit()
-    db.refresh(new_task)
-    return new_task
+    new_task = (await db.execute(stmt)).scalar_one()
+    await db.commit()
+    return _task_response(new_task)
 
 
-@router.get("/{task_id}", response_model=TaskResponse)
-def get_task(task_id: UUID, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    task = db.query(Task).filter(
-        Task.user_id == user.user_id,
-        Task.task_id == task_id
-    ).first()
+@router.post("/bulk_complete", response_model=None)
+async def bulk_complete_tasks(
+    task_ids: List[UUID],
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    """
+    複数タスクをまとめて完了にする。
+    タスクのUPDATEとtask_completedログのINSERTは1トランザクションに相乗りし、
+    ログN件は1回のflushでマルチロウINSERTになる（1件ずつPUTするよりDB往復が少ない）
+    """
+    if not task_ids:
+        raise HTTPException(status_code=400, detail="task_ids is empty")
 
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    tasks = (
+        (
+            await db.execute(
+                select(Task).where(
+                    Task.user_id == user.user_id, Task.task_id.in_(task_ids)
+                )
+            )
+        )
+        .scalars()
+        .all()
+    )
 
-    return task
+    completed = []
+    for task in tasks:
+        if task.status == TaskStatus.COMPLETED:
+            continue  # 既に完了済みならログも二重に作らない
+        task.status = TaskStatus.COMPLETED.value
+        task.completed_at = now
+        task.updated_at = now
 
+        due = to_naive_utc(task.due_date)
+        db.add(
+            EventLog(
+                user_id=user.user_id,
+                task_id=task.task_id,
+                event_type=EventType.TASK_COMPLETED.value,
+                device="backend",
+                data={
+                    "completion_time": now.isoformat(),
+                    "was_overdue": bool(due and now > due),
+                    "source": "backend_auto",
+                },
+            )
+        )
+        completed.append(task)
 
-@router.put("/{task_id}", response_model=TaskWithPlantResponse)
-def update_task(
+    await db.flush()
+    plant_update = await update_plant_level(user.user_id, db, commit=False)
+    await db.commit()
+
+    return {
+        "tasks": [_task_response(t) for t in completed],
+        "plant_update": plant_update,
+    }
+
+
+@router.get("/{task_id}", response_model=None)
+async def get_task(
+    task_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+) -> TaskResponse:
+    return _task_response(await _get_own_task(db, user.user_id, task_id))
+
+
+@router.put("/{task_id}", response_model=None)
+async def update_task(
     task_id: UUID,
     task_update: TaskUpdate,
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
 ):
-    task = db.query(Task).filter(
-        Task.user_id == user.user_id,
-        Task.task_id == task_id
-    ).first()
-
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task = await _get_own_task(db, user.user_id, task_id)
 
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
     prev_status = task.status
     status_changed_to_completed = False
 
     # --- 更新処理 ---
-    if task_update.title is not None:
-        task.title = task_update.title
-    if task_update.due_date is not None:
-        task.due_date = task_update.due_date
-    if task_update.self_due_date is not None:
-        task.self_due_date = task_update.self_due_date
-    if task_update.priority is not None:
-        task.priority = task_update.priority
-    if task_update.category is not None:
-        task.category = task_update.category
-
-    if task_update.status is not None:
-        task.status = task_update.status
-
-        # completed に「初めて」変わった瞬間
-        if task_update.status == "completed" and prev_status != "completed":
-            task.completed_at = datetime.utcnow()
+    # 「本当に送られてきたフィールド」だけを一括で反映する（if連打をやめる）
+    update_data = task_update.model_dump(exclude_unset=True)
+    new_status = update_data.pop("status", None)
+    update_data.pop("completed_at", None)  # completed_at はstatus遷移からだけ決める
+
+    for key, value in update_data.items():
+        setattr(task, key, value)
+
+    if new_status is not None:
+        task.status = new_status.value
+
+        # completed に「初めて」変わった瞬間（enumなので識別比較でよい）
+        if new_status is TaskStatus.COMPLETED and prev_status != TaskStatus.COMPLETED:
+            task.completed_at = now
             status_changed_to_completed = True
 
         # completed 以外に戻したら completed_at を消す
-        if task_update.status != "completed":
+        if new_status is not TaskStatus.COMPLETED:
             task.completed_at = None
 
-    task.updated_at = datetime.utcnow()
+    task.updated_at = now
 
     # --- ログを自動生成（task_completed）---
     if status_changed_to_completed:
@@ -133,29 +228,32 @@ def update_task(
         )
         db.add(log)
 
-    # 先に task / log を保存
-    db.commit()
-    db.refresh(task)
+    # 植物レベルの集計が未コミットの変更を見られるように先にflushだけしておく
+    await db.flush()
 
-    # 植物レベル更新（中で commit されても OK）
-    plant_update = update_plant_level(user.user_id, db)
+    # task / log / 植物レベルを同一トランザクションで確定（commitは最後に1回）
+    plant_update = await update_plant_level(user.user_id, db, commit=False)
 
-    return {
-        "task": task,
-        "plant_update": plant_update
-    }
+    await db.commit()
 
+    # PUTは一番叩かれる書き込みパスなので、Pydanticのシリアライザも通さず
+    # orjsonが直接エンコードできる素のdict（UUID/datetimeはorjsonがネイティブ対応）で返す
+    return ORJSONResponse(
+        {
+            "task": {f: getattr(task, f) for f in _TASK_FIELDS},
+            "plant_update": plant_update,
+        }
+    )
 
-@router.delete("/{task_id}")
-def delete_task(task_id: UUID, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    task = db.query(Task).filter(
-        Task.user_id == user.user_id,
-        Task.task_id == task_id
-    ).first()
 
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+@router.delete("/{task_id}")
+async def delete_task(
+    task_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    task = await _get_own_task(db, user.user_id, task_id)
 
-    db.delete(task)
-    db.commit()
-    return {"message": "Task deleted"}
\ No newline at end of file
+    await db.delete(task)
+    await db.commit()
+    return {"message": "Task deleted"}
@@ -1,17 +1,26 @@
 # schemas/task.py
+from enum import Enum
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional
 from uuid import UUID
 from schemas.plant import PlantUpdateResult
 
+
+class TaskStatus(str, Enum):
+    """タスクの状態（EventType と同じ文字列enum方式。DBには文字列のまま入る）"""
+    PENDING = "pending"
+    COMPLETED = "completed"
+    MISSED = "missed"
+
+
 class TaskBase(BaseModel):
     title: str
     due_date: Optional[datetime] = None
     self_due_date: Optional[datetime] = None
     priority: Optional[int] = 1
     category: Optional[str] = None
-    status: Optional[str] = "pending"
+    status: Optional[TaskStatus] = TaskStatus.PENDING
 
 class TaskCreate(TaskBase):
     pass
@@ -22,10 +31,12 @@ class TaskUpdate(BaseModel):
     self_due_date: Optional[datetime] = None
     priority: Optional[int] = None
     category: Optional[str] = None
-    status: Optional[str] = None
+    status: Optional[TaskStatus] = None
     completed_at: Optional[datetime] = None
 
 class TaskResponse(TaskBase):
+    # DBから来る値は素の文字列なので、レスポンス側はstrのまま扱う
+    status: Optional[str] = TaskStatus.PENDING.value
     task_id: UUID
     user_id: UUID
     created_at: datetime
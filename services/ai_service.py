@@ -1,135 +1,154 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+import hashlib
 import os
-from datetime import datetime
+import sys
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
 from typing import List, Tuple
+from cachetools import TTLCache
 from models.event_log import EventLog
-from models.task import Task
 from models.user import User
 from schemas.event_log import EventType
-import json
+import orjson
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# LLM往復(1〜3秒)でワーカースレッドを塞がないようasyncクライアントを使う
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 IDLE_GAP_MINUTES = 15  # 無操作区間でセッションを分割
+_IDLE_GAP_TD = timedelta(minutes=IDLE_GAP_MINUTES)
 
+# enum→文字列の解決はプロセス内で不変なのでモジュールロード時に1回だけ（routers/ai.py と同じ流儀）
+_DAILY_CHECK_IN = EventType.DAILY_CHECK_IN.value
+_SCREEN_TRANSITION = EventType.SCREEN_TRANSITION.value
+_BUTTON_CLICKED = EventType.BUTTON_CLICKED.value
+_TASK_STARTED = EventType.TASK_STARTED.value
+_TASK_COMPLETED = EventType.TASK_COMPLETED.value
+_WAKE_TIME_LOGGED = EventType.WAKE_TIME_LOGGED.value
 
-# -------------------------
-# helpers
-# -------------------------
-def _parse_iso(dt_str: str) -> datetime | None:
-    try:
-        if dt_str.endswith("Z"):
-            dt_str = dt_str.replace("Z", "+00:00")
-        return datetime.fromisoformat(dt_str)
-    except Exception:
-        return None
+# 同じ入力ならLLMを呼び直さない（1時間有効）。
+# キーは入力全体をキー順ソートでシリアライズしたものの固定長ハッシュ
+_feedback_cache: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+_feedback_cache_lock = threading.Lock()
 
 
-def _extract_daily_check_in(logs: List[EventLog]) -> int:
-    return 1 if any(l.event_type == EventType.DAILY_CHECK_IN.value for l in logs) else 0
+def _feedback_cache_key(input_data: dict) -> str | None:
+    if "total" not in input_data.get("scores", {}):
+        return None  # スコアが出せていない入力はキャッシュしない
 
+    try:
+        payload = orjson.dumps(input_data, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return None  # シリアライズ不能な値が混ざっていたら諦める
 
-def _pair_task_sessions(logs: List[EventLog]) -> List[Tuple[datetime, datetime]]:
-    """
-    task_started -> task_completed を task_id でペアにしてセッションを作る
-    """
-    started: dict[str, datetime] = {}
-    sessions: List[Tuple[datetime, datetime]] = []
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
 
-    for l in logs:
-        if not l.task_id:
-            continue
-        tid = str(l.task_id)
 
-        if l.event_type == EventType.TASK_STARTED.value:
-            started[tid] = l.timestamp
+# -------------------------
+# helpers
+# -------------------------
+# 3.11+ の fromisoformat は末尾 "Z" をそのまま受ける
+_FROMISO_HANDLES_Z = sys.version_info >= (3, 11)
 
-        if l.event_type == EventType.TASK_COMPLETED.value:
-            if tid in started:
-                s = started.pop(tid)
-                e = l.timestamp
-                if e > s:
-                    sessions.append((s, e))
 
-    return sessions
+def _parse_iso(dt_str: str) -> datetime | None:
+    try:
+        if not _FROMISO_HANDLES_Z and dt_str.endswith("Z"):
+            dt_str = dt_str[:-1] + "+00:00"
+        return datetime.fromisoformat(dt_str)
+    except Exception:
+        return None
 
 
 def _activity_sessions_from_timestamps(logs: List[EventLog]) -> List[Tuple[datetime, datetime]]:
     """
     logs の時系列から、無操作(IDLE_GAP_MINUTES以上)で区切ってセッションを作る（補助用）
+
+    logs は timestamp 昇順で渡すこと（/ai/feedback はSQL側で ORDER BY 済み）。
+    Timsortでも整列済みリストの再ソートは1周ぶんの比較を払うので、ここでは並べ直さない
     """
     if not logs:
         return []
 
     ts = [l.timestamp for l in logs]
-    ts.sort()
 
     sessions: List[Tuple[datetime, datetime]] = []
     cur_start = ts[0]
     cur_end = ts[0]
 
+    # timedelta同士で直接比較する（毎周の total_seconds()+除算をやめる）
+    gap_td = _IDLE_GAP_TD
     for t in ts[1:]:
-        gap = (t - cur_end).total_seconds() / 60
-        if gap >= IDLE_GAP_MINUTES:
+        if t - cur_end >= gap_td:
             sessions.append((cur_start, cur_end))
             cur_start = t
-            cur_end = t
-        else:
-            cur_end = t
+        cur_end = t
 
     sessions.append((cur_start, cur_end))
     return sessions
 
 
-def _calc_session_metrics(logs: List[EventLog]) -> tuple[int, float]:
-    """
-    session_count, avg_session_minutes を返す
-    優先: task_started/task_completed のペア
-    補助: 活動セッション(無操作区間で分割)
-    """
-    paired = _pair_task_sessions(logs)
-
-    durations = []
-    for s, e in paired:
-        durations.append((e - s).total_seconds() / 60)
-
-    # ペアが少ない場合は、活動セッションでも補完
-    if len(durations) < 1:
-        act = _activity_sessions_from_timestamps(logs)
-        for s, e in act:
-            dur = (e - s).total_seconds() / 60
-            if dur >= 1:
-                durations.append(dur)
-
-    if not durations:
-        return 0, 0.0
-
-    session_count = len(durations)
-    avg_minutes = sum(durations) / len(durations)
-    return session_count, avg_minutes
+# バンドの下限しきい値（昇順）。bisectでテーブル引きする
+_BAND_THRESHOLDS = (40, 60, 80)
+_BANDS = (
+    ("low", "今日は控えめな一日"),
+    ("ok", "まずまずの一日"),
+    ("good", "ええ感じに進んだ一日"),
+    ("great", "かなりええ流れの一日"),
+)
 
 
 def _score_band(total: int) -> tuple[str, str]:
     """
     total_score(0-100想定) を「言い方」に変換する
     """
-    if total >= 80:
-        return ("great", "かなりええ流れの一日")
-    if total >= 60:
-        return ("good", "ええ感じに進んだ一日")
-    if total >= 40:
-        return ("ok", "まずまずの一日")
-    return ("low", "今日は控えめな一日")
+    return _BANDS[bisect_right(_BAND_THRESHOLDS, total)]
 
 
 # -------------------------
 # scoring (rule-based)
 # -------------------------
-def calculate_scores(logs: List[EventLog], tasks: List[Task], user: User):
-    completed = sum(1 for t in tasks if t.status == "completed")
-    overdue = sum(1 for t in tasks if t.status == "missed")
+def calculate_scores(logs: List[EventLog], completed: int, overdue: int, user: User):
+    """
+    completed / overdue はDB側で集計済みの件数を受け取る（全タスクは持ってこない）。
+    logs は1回だけ走査して、チェックイン/ノイズ/セッションペア/起床ログを同時に拾う
+    """
+    # ループ内はローカル参照で比較する（LOAD_GLOBALも避ける）
+    check_in_et = _DAILY_CHECK_IN
+    screen_et = _SCREEN_TRANSITION
+    click_et = _BUTTON_CLICKED
+    started_et = _TASK_STARTED
+    completed_et = _TASK_COMPLETED
+    wake_et = _WAKE_TIME_LOGGED
+
+    daily_check_in = 0
+    screen_moves = button_clicks = 0
+    wake_time_log = None
+    started: dict[str, datetime] = {}
+    durations: list[float] = []
 
-    daily_check_in = _extract_daily_check_in(logs)
+    for l in logs:
+        et = l.event_type
+        if et == screen_et:
+            screen_moves += 1
+        elif et == click_et:
+            button_clicks += 1
+        elif et == check_in_et:
+            daily_check_in = 1
+        elif et == started_et:
+            if l.task_id:
+                started[str(l.task_id)] = l.timestamp
+        elif et == completed_et:
+            if l.task_id:
+                tid = str(l.task_id)
+                if tid in started:
+                    s = started.pop(tid)
+                    e = l.timestamp
+                    if e > s:
+                        durations.append((e - s).total_seconds() / 60)
+        elif et == wake_et:
+            if wake_time_log is None and l.data:
+                wake_time_log = l
 
     completion_rate = 0.0
     if (completed + overdue) > 0:
@@ -144,11 +163,17 @@ def calculate_scores(logs: List[EventLog], tasks: List[Task], user: User):
         + 10 * completion_rate
     )
 
-    session_count, avg_session_min = _calc_session_metrics(logs)
+    # ペアが取れない日は活動セッション(無操作区間で分割)で補完
+    if not durations:
+        for s, e in _activity_sessions_from_timestamps(logs):
+            dur = (e - s).total_seconds() / 60
+            if dur >= 1:
+                durations.append(dur)
+
+    session_count = len(durations)
+    avg_session_min = sum(durations) / session_count if session_count else 0.0
 
-    # "画面移動/クリック多すぎ" ペナルティも入れたいならここで軽く
-    screen_moves = sum(1 for l in logs if l.event_type == EventType.SCREEN_TRANSITION.value)
-    button_clicks = sum(1 for l in logs if l.event_type == EventType.BUTTON_CLICKED.value)
+    # "画面移動/クリック多すぎ" ペナルティ
     noise = screen_moves + button_clicks
 
     base_focus = 60 * min(session_count / 3, 1) + 40 * min(avg_session_min / 30, 1)
@@ -156,7 +181,6 @@ def calculate_scores(logs: List[EventLog], tasks: List[Task], user: User):
     FOCUS = max(base_focus - penalty, 0)
 
     # ---- Energy ----
-    wake_time_log = next((l for l in logs if l.event_type == EventType.WAKE_TIME_LOGGED.value and l.data), None)
     first_action = logs[0].timestamp if logs else None
 
     wake_score = 0
@@ -199,15 +223,8 @@ def calculate_scores(logs: List[EventLog], tasks: List[Task], user: User):
 # -------------------------
 # feedback generation (must include total feeling)
 # -------------------------
-def generate_feedback(input_data: dict):
-    try:
-        total = int(input_data.get("scores", {}).get("total", 0))
-    except Exception:
-        total = 0
-
-    _, band_text = _score_band(total)
-
-    prompt = f"""
+# 指示ブロック(約1KB)は不変なので、毎回f-stringで組み立てずテンプレとして持つ
+_PROMPT_TEMPLATE = """
 あなたはユーザーの行動分析コーチです。
 与えられた JSON の行動データとスコアを用いて、ユーザーに1日のフィードバックを返してください。
 
@@ -235,11 +252,32 @@ def generate_feedback(input_data: dict):
 - 命令口調禁止
 
 以下の JSON を解析してフィードバックを生成してください：
-{json.dumps(input_data, ensure_ascii=False)}
+{payload}
 """
+async def generate_feedback(input_data: dict):
+    cache_key = _feedback_cache_key(input_data)
+
+    if cache_key is not None:
+        with _feedback_cache_lock:
+            cached = _feedback_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)  # 呼び出し側がdebugキーを足すのでコピーを返す
+
+    try:
+        total = int(input_data.get("scores", {}).get("total", 0))
+    except Exception:
+        total = 0
+
+    _, band_text = _score_band(total)
+
+    prompt = _PROMPT_TEMPLATE.format(
+        total=total,
+        band_text=band_text,
+        payload=orjson.dumps(input_data).decode(),
+    )
 
     try:
-        resp = client.chat.completions.create(
+        resp = await client.chat.completions.create(
             model="gpt-4o-mini",
             response_format={"type": "json_object"},
             messages=[
@@ -248,7 +286,7 @@ def generate_feedback(input_data: dict):
             ],
         )
     except TypeError:
-        resp = client.chat.completions.create(
+        resp = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a helpful AI coach. Output MUST be a JSON object."},
@@ -259,10 +297,16 @@ def generate_feedback(input_data: dict):
     text = resp.choices[0].message.content or ""
 
     try:
-        return json.loads(text)
+        result = orjson.loads(text)
     except Exception:
-        return {
+        result = {
             "message": text,
             "advice": "",
             "encourage": "今日もお疲れさま。よう頑張ったで。",
-        }
\ No newline at end of file
+        }
+
+    if cache_key is not None:
+        with _feedback_cache_lock:
+            _feedback_cache[cache_key] = result
+
+    return result
\ No newline at end of file
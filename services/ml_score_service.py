@@ -1,17 +1,20 @@
 from __future__ import annotations
 
 import os
+import sys
+import threading
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any
 
 import joblib
 
 from models.event_log import EventLog
-from models.task import Task
 from models.user import User
 
 
 _MODEL = None  # 起動時に1回だけロードして保持
+_MODEL_LOADED = False  # 「ロード試行済み（見つからず None）」と「未ロード」を区別する
+_model_lock = threading.Lock()
 
 FEATURES = [
     "completed_tasks",
@@ -38,11 +41,15 @@ def _to_naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
     return dt
 
 
+# 3.11+ の fromisoformat は末尾 "Z" をそのまま受ける
+_FROMISO_HANDLES_Z = sys.version_info >= (3, 11)
+
+
 def _parse_iso(dt_str: str) -> Optional[datetime]:
     """Z付きISOもパースできるようにする"""
     try:
-        if dt_str.endswith("Z"):
-            dt_str = dt_str.replace("Z", "+00:00")
+        if not _FROMISO_HANDLES_Z and dt_str.endswith("Z"):
+            dt_str = dt_str[:-1] + "+00:00"
         return datetime.fromisoformat(dt_str)
     except Exception:
         return None
@@ -56,57 +63,34 @@ def load_model() -> None:
     FastAPI起動時に1回だけ呼ぶ想定。
     毎リクエストロードしない。
     """
-    global _MODEL
-
-    base_dir = os.path.dirname(os.path.dirname(__file__))  # project root
-    default_path = os.path.join(base_dir, "ml_models", "daily_score_model.pkl")
-    model_path = os.getenv("DAILY_SCORE_MODEL_PATH", default_path)
-
-    if not os.path.exists(model_path):
-        _MODEL = None
-        print(f"[ml_score_service] model not found: {model_path} (fallback to rule-based)")
-        return
-
-    _MODEL = joblib.load(model_path)
-    print(f"[ml_score_service] model loaded: {model_path}")
-
+    global _MODEL, _MODEL_LOADED
 
-# -------------------------
-# session features (task logs)
-# -------------------------
-def _pair_task_sessions(logs: List[EventLog]) -> List[Tuple[datetime, datetime]]:
-    """
-    task_started -> task_completed を task_id でペアにしてセッション化
-    """
-    started: dict[str, datetime] = {}
-    sessions: List[Tuple[datetime, datetime]] = []
+    with _model_lock:
+        if _MODEL_LOADED:
+            return
 
-    for l in logs:
-        if not l.task_id:
-            continue
-        tid = str(l.task_id)
+        base_dir = os.path.dirname(os.path.dirname(__file__))  # project root
+        default_path = os.path.join(base_dir, "ml_models", "daily_score_model.pkl")
+        model_path = os.getenv("DAILY_SCORE_MODEL_PATH", default_path)
 
-        ts = _to_naive_utc(l.timestamp) or l.timestamp
+        if not os.path.exists(model_path):
+            _MODEL = None
+            _MODEL_LOADED = True
+            print(f"[ml_score_service] model not found: {model_path} (fallback to rule-based)")
+            return
 
-        if l.event_type == "task_started":
-            started[tid] = ts
+        # mmap_mode="r": モデル内のnumpy配列をメモリマップで共有する
+        # （uvicornワーカーごとにRSSを複製しない。配列は初回推論まで実読み込みされない）
+        _MODEL = joblib.load(model_path, mmap_mode="r")
+        _MODEL_LOADED = True
+        print(f"[ml_score_service] model loaded: {model_path}")
 
-        if l.event_type == "task_completed" and tid in started:
-            s = started.pop(tid)
-            e = ts
-            if e > s:
-                sessions.append((s, e))
 
-    return sessions
-
-
-def _calc_session_metrics_from_tasks(logs: List[EventLog]) -> tuple[int, float]:
-    paired = _pair_task_sessions(logs)
-    if not paired:
-        return 0, 0.0
-
-    mins = [(e - s).total_seconds() / 60.0 for s, e in paired]
-    return len(mins), float(sum(mins) / len(mins))
+def _get_model():
+    """起動フックを経由しない呼び出し（別ワーカー等）でも1回だけロードする"""
+    if not _MODEL_LOADED:
+        load_model()
+    return _MODEL
 
 
 # -------------------------
@@ -114,25 +98,53 @@ def _calc_session_metrics_from_tasks(logs: List[EventLog]) -> tuple[int, float]:
 # -------------------------
 def _extract_features(
     logs: List[EventLog],
-    tasks: List[Task],
+    completed_tasks: int,
+    overdue_tasks: int,
     user: User,
 ) -> Dict[str, Any]:
     """
-    学習時の特徴量に合わせて作る（順番は FEATURES で統一）
+    学習時の特徴量に合わせて作る（順番は FEATURES で統一）。
+    completed/overdue はDB集計済みの件数で受け取る。
     """
-    completed_tasks = sum(1 for t in tasks if t.status == "completed")
-    overdue_tasks = sum(1 for t in tasks if t.status == "missed")
-
     denom = completed_tasks + overdue_tasks
     completion_rate = (completed_tasks / denom) if denom > 0 else 0.0
 
     # streak_days は今DBで安定して出せないなら0でOK（後で routers側の算出に合わせて差し替え）
     streak_days = 0
 
-    daily_check_in = 1 if any(l.event_type == "daily_check_in" for l in logs) else 0
+    # logs も1周で daily_check_in / セッションペア / wake / 初動 を全部拾う
+    daily_check_in = 0
+    started: dict[str, datetime] = {}
+    session_minutes_sum = 0.0
+    session_count = 0
+    wake_log = None
+    first_action_log = None
 
-    # session metrics（task_started/task_completed）
-    session_count, avg_session_minutes = _calc_session_metrics_from_tasks(logs)
+    for l in logs:
+        et = l.event_type
+
+        if et == "daily_check_in":
+            daily_check_in = 1
+
+        if l.task_id:
+            tid = str(l.task_id)
+            ts = _to_naive_utc(l.timestamp) or l.timestamp
+            if et == "task_started":
+                started[tid] = ts
+            elif et == "task_completed" and tid in started:
+                s = started.pop(tid)
+                if ts > s:
+                    session_minutes_sum += (ts - s).total_seconds() / 60.0
+                    session_count += 1
+
+        if wake_log is None and et == "wake_time_logged" and isinstance(l.data, dict):
+            wake_log = l
+        if first_action_log is None and et != "wake_time_logged":
+            first_action_log = l
+
+    avg_session_minutes = (
+        session_minutes_sum / session_count if session_count else 0.0
+    )
 
     # 何も取れない時のfallback（モデルが極端に外れんように）
     if session_count == 0 and avg_session_minutes == 0.0:
@@ -142,7 +154,6 @@ def _extract_features(
     wake_hour = 9
     first_action_delay_hours = 5.0
 
-    wake_log = next((l for l in logs if l.event_type == "wake_time_logged" and isinstance(l.data, dict)), None)
     if wake_log and wake_log.data.get("time"):
         wake_dt = _parse_iso(str(wake_log.data["time"]))
         wake_dt = _to_naive_utc(wake_dt)
@@ -150,14 +161,14 @@ def _extract_features(
         if wake_dt:
             wake_hour = int(wake_dt.hour)
 
-            # 起床ログ以外で最初のログ
-            first_action_log = next((x for x in logs if x.event_type != "wake_time_logged"), None)
+            # 起床ログ以外で最初のログ（上のループで取得済み）
             if first_action_log:
                 fa = _to_naive_utc(first_action_log.timestamp)
                 if fa:
                     diff = (fa - wake_dt).total_seconds() / 3600.0
                     first_action_delay_hours = float(max(diff, 0.0))
 
+    # キーは必ず FEATURES と同順で詰める（predict側が values() をそのまま行に使う）
     return {
         "completed_tasks": int(completed_tasks),
         "overdue_tasks": int(overdue_tasks),
@@ -174,30 +185,57 @@ def _extract_features(
 # -------------------------
 # predict
 # -------------------------
-def predict_total_score(logs: List[EventLog], tasks: List[Task], user: User) -> Optional[float]:
-    if _MODEL is None:
+def predict_total_score(
+    logs: List[EventLog], completed_tasks: int, overdue_tasks: int, user: User
+) -> Optional[float]:
+    model = _get_model()
+    if model is None:
         return None
 
-    feats = _extract_features(logs, tasks, user)
-    X = [[feats[f] for f in FEATURES]]
+    feats = _extract_features(logs, completed_tasks, overdue_tasks, user)
+    # feats は FEATURES 順で詰まっているので、dictを9回引き直さず values() で行を作る
+    X = [list(feats.values())]
 
-    pred = _MODEL.predict(X)[0]
+    pred = model.predict(X)[0]
     return float(pred)
 
 
+def predict_total_score_batch(
+    jobs: List[tuple],
+) -> List[Optional[float]]:
+    """
+    (logs, completed_tasks, overdue_tasks, user) のタプルをまとめて推論する。
+    デイリーダイジェスト等の全ユーザー一括用: model.predict を1回にまとめ、
+    sklearnの呼び出しオーバーヘッドをバッチ全体で割る。モデルが無ければ全件 None
+    """
+    model = _get_model()
+    if model is None:
+        return [None] * len(jobs)
+    if not jobs:
+        return []
+
+    X = [
+        list(_extract_features(logs, completed, overdue, user).values())
+        for logs, completed, overdue, user in jobs
+    ]
+    return [float(p) for p in model.predict(X)]
+
+
 def predict_total_score_debug(
     logs: List[EventLog],
-    tasks: List[Task],
+    completed_tasks: int,
+    overdue_tasks: int,
     user: User,
 ) -> tuple[Optional[float], Dict[str, Any]]:
     """
     (pred, features) を返す。モデル無い時は (None, features)。
     """
-    feats = _extract_features(logs, tasks, user)
+    feats = _extract_features(logs, completed_tasks, overdue_tasks, user)
 
-    if _MODEL is None:
+    model = _get_model()
+    if model is None:
         return None, feats
 
-    X = [[feats[f] for f in FEATURES]]
-    pred = _MODEL.predict(X)[0]
+    X = [list(feats.values())]
+    pred = model.predict(X)[0]
     return float(pred), feats
\ No newline at end of file
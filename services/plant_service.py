@@ -1,35 +1,55 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.plant import Plant
 from models.task import Task
 from datetime import datetime, timedelta
 import uuid
 
 
-def get_week_start(dt: datetime = None) -> datetime:
-    """
-    指定された日時(デフォルトは現在UTC時刻)を含む週の月曜日00:00:00を返す
-    """
-    if dt is None:
-        dt = datetime.utcnow()
-    
+# 「今週の月曜0時」は週に1回しか変わらないのでキャッシュする
+# (valid_until, week_start) のタプルで持つ
+_week_start_cache: tuple[datetime, datetime] | None = None
+
+
+def _calc_week_start(dt: datetime) -> datetime:
     # 曜日を取得 (月曜=0, 日曜=6)
     weekday = dt.weekday()
-    
+
     # 今週の月曜日を計算
     monday = dt - timedelta(days=weekday)
-    
+
     # 時刻を00:00:00にリセット
     return monday.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
-def update_plant_level(user_id: uuid.UUID, db: Session) -> dict:
+def get_week_start(dt: datetime = None) -> datetime:
+    """
+    指定された日時(デフォルトは現在UTC時刻)を含む週の月曜日00:00:00を返す
+    """
+    global _week_start_cache
+
+    if dt is not None:
+        return _calc_week_start(dt)
+
+    now = datetime.utcnow()
+    cached = _week_start_cache
+    if cached is not None and now < cached[0]:
+        return cached[1]
+
+    week_start = _calc_week_start(now)
+    _week_start_cache = (week_start + timedelta(days=7), week_start)
+    return week_start
+
+
+async def update_plant_level(user_id: uuid.UUID, db: AsyncSession, commit: bool = True) -> dict:
     """
     ユーザーの植物レベルを週次タスク完了率に基づいて更新する
-    
+
     Args:
         user_id: ユーザーID
-        db: データベースセッション
-    
+        db: データベースセッション（async）
+        commit: Falseなら呼び出し側のトランザクションに相乗りする（内部でcommitしない）
+
     Returns:
         dict: {
             "current_level": int,      # 更新後のレベル (0-10)
@@ -39,30 +59,32 @@ def update_plant_level(user_id: uuid.UUID, db: Session) -> dict:
     """
     # 今週の開始日時を取得 (月曜日 00:00:00 UTC)
     week_start = get_week_start()
-    
-    # 今週作成されたタスクを取得
-    total_tasks = db.query(Task).filter(
-        Task.user_id == user_id,
-        Task.created_at >= week_start
-    ).count()
-    
-    # 今週作成されたタスクのうち完了したものを取得
-    completed_tasks = db.query(Task).filter(
-        Task.user_id == user_id,
-        Task.created_at >= week_start,
-        Task.status == "completed"
-    ).count()
-    
+
+    # 今週作成されたタスクの件数と、そのうち完了した件数を1クエリで集計する
+    # （COUNT FILTER なら同じ行を2回スキャンせずに済む）
+    total_tasks, completed_tasks = (
+        await db.execute(
+            select(
+                func.count(),
+                func.count().filter(Task.status == "completed"),
+            )
+            .select_from(Task)
+            .where(Task.user_id == user_id, Task.created_at >= week_start)
+        )
+    ).one()
+
     # レベルを計算
     if total_tasks == 0:
         new_level = 0
     else:
         completion_rate = completed_tasks / total_tasks
         new_level = min(int(completion_rate * 10), 10)  # 0-10の範囲に制限
-    
+
     # 植物レコードを取得または作成
-    plant = db.query(Plant).filter(Plant.user_id == user_id).first()
-    
+    plant = (
+        await db.execute(select(Plant).where(Plant.user_id == user_id))
+    ).scalar_one_or_none()
+
     if plant is None:
         # 植物が存在しない場合は新規作成
         plant = Plant(
@@ -77,13 +99,14 @@ def update_plant_level(user_id: uuid.UUID, db: Session) -> dict:
         previous_level = plant.level
         plant.level = new_level
         plant.last_updated = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(plant)
-    
+
+    if commit:
+        # expire_on_commit=False なので commit 後も属性は有効（refreshの再SELECTは不要）
+        await db.commit()
+
     # レベルアップしたかどうかを判定
     leveled_up = new_level > previous_level
-    
+
     # メッセージを生成
     if leveled_up:
         message = "植物が育ちました！"
@@ -91,7 +114,7 @@ def update_plant_level(user_id: uuid.UUID, db: Session) -> dict:
         message = "植物のレベルが下がりました"
     else:
         message = "植物のレベルは変わりませんでした"
-    
+
     return {
         "current_level": new_level,
         "leveled_up": leveled_up,